@@ -1,87 +1,65 @@
-import ctypes
-from typing import Optional, Tuple
-from sig import extract_tce_func, extract_decipher_func, extract_n_transform_func
+from typing import Tuple, Union
+from sig import BodyMatches, extract_tce_func, extract_decipher_func, extract_n_transform_func
 
-def extract_decode_script(input_str: str) -> Tuple[bool, str]:
-    """
-    Python equivalent of the C FFI function extract_decode_script.
-    Returns (success: bool, result_or_error: str)
-    """
+def _extract_script(body: bytes) -> bytes:
+    """Run the extractors over the player bytes, raising ValueError on failure"""
+    # Shared so no static pattern scans the body twice
+    matches = BodyMatches(body)
     
-    def return_error(msg: str) -> Tuple[bool, str]:
-        """Helper function to return error consistently"""
-        return False, msg
+    # Extract TCE function
+    name, code = extract_tce_func(body, matches)
     
-    if input_str is None:
-        return return_error("Input string is null")
+    # Extract decipher and n-transform scripts
+    decipher_script = extract_decipher_func(body, code, matches)
+    n_transform_script = extract_n_transform_func(body, name, code, matches)
     
-    if not isinstance(input_str, str):
-        return return_error("Invalid Input string")
-    
-    body = input_str
+    return decipher_script + n_transform_script
+
+def _do_extract(input_str: Union[bytes, str]) -> str:
+    """Return the decode script for the player, raising ValueError on failure"""
+    if input_str is None:
+        raise ValueError("Input string is null")
     
-    try:
-        # Extract TCE function
-        etf = extract_tce_func(body)
-        name = etf.name
-        code = etf.code
-    except (ValueError, Exception) as e:
-        return return_error(str(e))
+    if isinstance(input_str, str):
+        body = input_str.encode('utf-8')
+    elif isinstance(input_str, bytes):
+        body = input_str
+    else:
+        raise ValueError("Invalid Input string")
     
-    try:
-        # Extract decipher script
-        decipher_script = extract_decipher_func(body, code)
-    except (ValueError, Exception) as e:
-        return return_error(str(e))
+    script = _extract_script(body)
     
+    # Decode only the extracted script
     try:
-        # Extract n-transform script
-        n_transform_script = extract_n_transform_func(body, name, code)
-    except (ValueError, Exception) as e:
-        return return_error(str(e))
-    
-    # Combine results
-    result = decipher_script + n_transform_script
-    
-    return True, result
+        return script.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ValueError("Invalid Input string") from None
 
-# Optional: Create a C-compatible wrapper using ctypes if needed
-class ExtractDecodeScriptWrapper:
+def extract_decode_script(input_str: Union[bytes, str]) -> Tuple[bool, str]:
     """
-    Wrapper class that provides C-compatible interface for the extract_decode_script function.
-    This can be used to create a shared library that matches the original C interface.
+    Python equivalent of the C FFI function extract_decode_script.
+    The player is matched as raw bytes; str input is encoded first.
+    Returns (success: bool, result_or_error: str)
     """
-    
-    @staticmethod
-    def create_c_string(s: str) -> ctypes.c_char_p:
-        """Create C string from Python string"""
-        return ctypes.c_char_p(s.encode('utf-8'))
-    
-    @staticmethod
-    def extract_decode_script_c_compat(input_ptr: ctypes.c_char_p) -> Tuple[bool, ctypes.c_char_p]:
-        """
-        C-compatible version that works with ctypes pointers
-        """
-        if not input_ptr:
-            return False, ExtractDecodeScriptWrapper.create_c_string("Input string is null")
-        
-        try:
-            input_str = input_ptr.decode('utf-8')
-        except UnicodeDecodeError:
-            return False, ExtractDecodeScriptWrapper.create_c_string("Invalid Input string")
-        
-        success, result = extract_decode_script(input_str)
-        return success, ExtractDecodeScriptWrapper.create_c_string(result)
+    try:
+        return True, _do_extract(input_str)
+    except ValueError as e:
+        return False, str(e)
+
+# Optional: the C-compatible wrapper lives in lib_ffi so that importing
+# this module does not pay for ctypes
+def __getattr__(name: str):
+    if name == "ExtractDecodeScriptWrapper":
+        from lib_ffi import ExtractDecodeScriptWrapper
+        return ExtractDecodeScriptWrapper
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # For direct usage without C compatibility
-def extract_decode_script_simple(javascript_code: str) -> str:
+def extract_decode_script_simple(javascript_code: Union[bytes, str]) -> str:
     """
     Simplified version that just returns the result or raises an exception
     """
-    success, result = extract_decode_script(javascript_code)
-    if not success:
-        raise ValueError(result)
-    return result
+    return _do_extract(javascript_code)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+import ctypes
+from typing import Union
+from lib import _extract_script
+
+class ExtractDecodeScriptWrapper:
+    """
+    Wrapper class that provides C-compatible interface for the extract_decode_script function.
+    This can be used to create a shared library that matches the original C interface.
+    """
+    
+    # Return codes of extract_decode_script_c_compat
+    OK = 0
+    ERROR = 1
+    BUFFER_TOO_SMALL = 2
+    
+    _NULL_INPUT_ERROR = b"Input string is null"
+    
+    @staticmethod
+    def extract_decode_script_c_compat(
+        input_ptr: Union[bytes, ctypes.c_char_p],
+        out_buf: ctypes.Array,
+        out_cap: int,
+        out_len_ptr: ctypes.POINTER(ctypes.c_size_t),
+    ) -> int:
+        """
+        C-compatible version that writes into a caller-owned buffer.
+        The script, or the error message for ERROR, is copied into out_buf
+        and its length stored in out_len_ptr[0]. If it does not fit in
+        out_cap bytes nothing is copied, BUFFER_TOO_SMALL is returned and
+        out_len_ptr[0] holds the required size.
+        """
+        if isinstance(input_ptr, ctypes.c_char_p):
+            input_ptr = input_ptr.value
+        
+        if not input_ptr:
+            status, data = ExtractDecodeScriptWrapper.ERROR, ExtractDecodeScriptWrapper._NULL_INPUT_ERROR
+        else:
+            # The raw bytes are matched and returned without decoding
+            try:
+                status, data = ExtractDecodeScriptWrapper.OK, _extract_script(bytes(input_ptr))
+            except ValueError as e:
+                status, data = ExtractDecodeScriptWrapper.ERROR, str(e).encode('utf-8')
+        
+        out_len_ptr[0] = len(data)
+        if len(data) > out_cap:
+            return ExtractDecodeScriptWrapper.BUFFER_TOO_SMALL
+        
+        ctypes.memmove(out_buf, data, len(data))
+        return status
@@ -1,6 +1,12 @@
+import functools
 import re
-from typing import Tuple, Union, NamedTuple
-from dataclasses import dataclass
+import sys
+from typing import Optional, Tuple, Union, NamedTuple
+
+try:
+    import re2
+except ImportError:
+    re2 = None
 
 # Type alias for Result
 Result = Union[str, Exception]
@@ -46,7 +52,7 @@ N_TRANSFORM_REGEXP = (
     r"\s*(\w+)=(\[.*?\]);\s*\3\[\d+\]"
     r"(.*?try)(\{.*?\})catch\(\s*(\w+)\s*\)\s*\{"
     r"\s*return\"[\w-]+([A-z0-9-]+)\"\s*\+\s*\1\s*}"
-    r"\s*return\s*(\2\.join\(\"\")|Array\.prototype\.join\.call\(\2,.*?\))};"
+    r"\s*return\s*(\2\.join\(\"\"\)|Array\.prototype\.join\.call\(\2,.*?\))};"
 )
 
 N_TRANSFORM_TCE_REGEXP = (
@@ -59,8 +65,8 @@ N_TRANSFORM_TCE_REGEXP = (
 
 TCE_GLOBAL_VARS_REGEXP = (
     r"(?:^|[;,])\s*(var\s+([\w$]+)\s*=\s*"
-    r"(?:([\"'])(?:\\.|[^\\])*?\3\s*\.\s*split\(([\"'])(?:\\.|[^\\])*?\5\)"
-    r"|\[\s*(?:([\"'])(?:\\.|[^\\])*?\6\s*,?\s*)+\]))(?=\s*[,;])"
+    r"(?:([\"'])(?:\\.|[^\\])*?\3\s*\.\s*split\(([\"'])(?:\\.|[^\\])*?\4\)"
+    r"|\[\s*(?:([\"'])(?:\\.|[^\\])*?\5\s*,?\s*)+\]))(?=\s*[,;])"
 )
 
 NEW_TCE_GLOBAL_VARS_REGEXP = (
@@ -104,34 +110,160 @@ REVERSE_PATTERN = rf"(?m){PATTERN_PREFIX}{REVERSE_PART}"
 SLICE_PATTERN = rf"(?m){PATTERN_PREFIX}{SLICE_PART}"
 SPLICE_PATTERN = rf"(?m){PATTERN_PREFIX}{SPLICE_PART}"
 SWAP_PATTERN = rf"(?m){PATTERN_PREFIX}{SWAP_PART}"
+PATTERN_ANY = rf"(?m){PATTERN_PREFIX}(?:{REVERSE_PART}|{SLICE_PART}|{SPLICE_PART}|{SWAP_PART})"
 
 FOR_PARAM_MATCHING = r"function\s*\(\s*(\w+)\s*\)"
 
 DECIPHER_FUNC_NAME = "DisTubeDecipherFunc"
 N_TRANSFORM_FUNC_NAME = "DisTubeNTransformFunc"
 
-@dataclass
-class ExtractTceFunc:
-    name: str
-    code: str
+_DECIPHER_FUNC_NAME = DECIPHER_FUNC_NAME.encode()
+_N_TRANSFORM_FUNC_NAME = N_TRANSFORM_FUNC_NAME.encode()
+
+# Unrolled string and brace loops that never need to give back characters
+_POSSESSIVE_LOOPS = (
+    (r"[^{}]*", r"[^{}]*+"),
+    (r"[^{}]*+)*}", r"[^{}]*+)*+}"),
+    (r"[^)]*", r"[^)]*+"),
+    (r"[^\"\\]*", r"[^\"\\]*+"),
+    (r"[^\"\\]*+)*", r"[^\"\\]*+)*+"),
+    (r"[^'\\]*", r"[^'\\]*+"),
+    (r"[^'\\]*+)*", r"[^'\\]*+)*+"),
+)
+
+def _possessive(pattern: str) -> str:
+    """Make the loops of a pattern possessive to bound backtracking"""
+    for loop, possessive_loop in _POSSESSIVE_LOOPS:
+        pattern = pattern.replace(loop, possessive_loop)
+    return pattern
+
+def _compile(pattern: str, flags: int = 0, use_re2: bool = True, possessive: bool = False) -> re.Pattern:
+    """Compile a pattern for matching bytes, with re2 when available"""
+    if use_re2 and re2 is not None:
+        # re2 takes flags inline rather than as an argument
+        inline = "".join(
+            letter for flag, letter in ((re.DOTALL, "s"), (re.MULTILINE, "m")) if flags & flag
+        )
+        try:
+            return re2.compile((f"(?{inline}){pattern}" if inline else pattern).encode())
+        except re2.error:
+            pass
+    # re2 never backtracks; re supports possessive quantifiers since 3.11
+    if possessive and sys.version_info >= (3, 11):
+        pattern = _possessive(pattern)
+    return re.compile(pattern.encode(), flags)
+
+# Static patterns are compiled once at import time. The player is matched
+# as raw bytes, which is valid because every pattern is pure ASCII.
+# Patterns using backreferences are not supported by re2 and stay on re.
+_NEW_TCE_GLOBAL_VARS_RE = _compile(NEW_TCE_GLOBAL_VARS_REGEXP, re.MULTILINE, possessive=True)
+_TCE_SIGN_FUNCTION_RE = _compile(TCE_SIGN_FUNCTION_REGEXP, re.DOTALL, use_re2=False)
+_TCE_SIGN_FUNCTION_ACTION_RE = _compile(TCE_SIGN_FUNCTION_ACTION_REGEXP, re.DOTALL, possessive=True)
+_HELPER_RE = _compile(HELPER_REGEXP, re.DOTALL)
+_DECIPHER_RE = _compile(DECIPHER_REGEXP, re.DOTALL, use_re2=False)
+_FUNCTION_TCE_RE = _compile(FUNCTION_TCE_REGEXP, re.DOTALL)
+_TCE_GLOBAL_VARS_RE = _compile(TCE_GLOBAL_VARS_REGEXP, re.MULTILINE, use_re2=False)
+_TCE_N_FUNCTION_RE = _compile(TCE_N_FUNCTION_REGEXP, re.DOTALL, use_re2=False)
+_N_TRANSFORM_RE = _compile(N_TRANSFORM_REGEXP, re.DOTALL, use_re2=False)
+_N_TRANSFORM_TCE_RE = _compile(N_TRANSFORM_TCE_REGEXP, re.DOTALL, use_re2=False)
+_FOR_PARAM_RE = _compile(FOR_PARAM_MATCHING, use_re2=False)
+_PATTERN_ANY_RE = _compile(PATTERN_ANY)
+
+_NAME_CHARS = frozenset(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$")
 
-def build_regex(pattern: str, flags: int = 0) -> re.Pattern:
-    """Build regex pattern with error handling"""
-    try:
-        return re.compile(pattern, flags)
-    except re.error as e:
-        raise ValueError(f"Invalid regex pattern: {pattern}") from e
+class _DecipherScanner:
+    """
+    DECIPHER_REGEXP search specialized to its literal shape.
+    Candidates are found with bytes.find on the split call and checked
+    at fixed offsets, so the regex only runs where a match can start.
+    """
+    
+    ANCHOR = b'.split("");'
+    
+    @staticmethod
+    def _starts(body: bytes, anchor: int) -> Tuple[int, ...]:
+        """Possible match starts for "function[ NAME](p){p=p" before an anchor"""
+        param = body[anchor - 1:anchor]
+        paren = anchor - 7
+        if paren < 0 or not param.isalpha() or body[paren:anchor] != b"(" + param + b"){" + param + b"=" + param:
+            return ()
+        
+        starts = []
+        # Named form first, as it starts further left
+        name_start = paren
+        while name_start > 0 and body[name_start - 1] in _NAME_CHARS:
+            name_start -= 1
+        if name_start < paren and body[name_start - 9:name_start] == b"function ":
+            starts.append(name_start - 9)
+        if body[paren - 8:paren] == b"function":
+            starts.append(paren - 8)
+        return tuple(starts)
+    
+    def search(self, body: bytes) -> Optional[re.Match]:
+        anchor = body.find(self.ANCHOR)
+        while anchor != -1:
+            # Starts grow with the anchor, so the first hit is the leftmost match
+            for start in self._starts(body, anchor):
+                match = _DECIPHER_RE.match(body, start)
+                if match:
+                    return match
+            anchor = body.find(self.ANCHOR, anchor + 1)
+        return None
+
+_DECIPHER_SCANNER = _DecipherScanner()
+
+class ExtractTceFunc(NamedTuple):
+    name: bytes
+    code: bytes
+
+class BodyMatches(dict):
+    """First match of each static pattern in a body, searched on first lookup"""
+    
+    def __init__(self, body: bytes):
+        super().__init__()
+        self.body = body
+    
+    def __missing__(self, pattern: re.Pattern) -> Optional[re.Match]:
+        match = self[pattern] = pattern.search(self.body)
+        return match
+
+# The TCE global and the n-function parameter take very few distinct
+# values per process, so their dynamic patterns are compiled once each
+@functools.lru_cache(maxsize=128)
+def _short_circuit_re(name: bytes) -> re.Pattern:
+    """Pattern for the n-function guard that returns early on a TCE lookup"""
+    return re.compile(
+        rb";\s*if\s*\(\s*typeof\s+[a-zA-Z0-9_$]+\s*===?\s*(?:\"undefined\"|'undefined'|"
+        + re.escape(name) + rb"\[\d+\])\s*\)\s*return\s+\w+;"
+    )
 
-def extract_tce_func(body: str) -> ExtractTceFunc:
+@functools.lru_cache(maxsize=128)
+def _cleaned_function_re(param_name: bytes) -> re.Pattern:
+    """Pattern for the typeof guard that returns the n-function parameter"""
+    return re.compile(
+        rb"if\s*\(typeof\s*[^\s()]+\s*===?.*?\)return " + re.escape(param_name) + rb"\s*;?"
+    )
+
+def _splice_parts(data: bytes, match: Optional[re.Match], replacement: bytes = b"") -> Tuple:
+    """Parts of data with the matched span replaced, to be copied once by a join"""
+    if not match:
+        return (data,)
+    start, end = match.span()
+    view = memoryview(data)
+    return (view[:start], replacement, view[end:])
+
+def extract_tce_func(body: bytes, matches: Optional[BodyMatches] = None) -> ExtractTceFunc:
     """Extract TCE function from JavaScript body"""
-    tce_variable_matcher = build_regex(NEW_TCE_GLOBAL_VARS_REGEXP, re.MULTILINE)
-    match = tce_variable_matcher.search(body)
+    if matches is None:
+        matches = BodyMatches(body)
+    match = matches[_NEW_TCE_GLOBAL_VARS_RE]
     
     if not match:
         raise ValueError(f"No captures found for input using regex 'NEW_TCE_GLOBAL_VARS_REGEXP'")
     
-    code = match.group('code')
-    varname = match.group('varname')
+    # Numbered, since re2 keys the names by bytes for bytes patterns
+    code = match.group(2)
+    varname = match.group(3)
     
     if not code:
         raise ValueError(f"No capture group named 'code' found using regex 'NEW_TCE_GLOBAL_VARS_REGEXP'")
@@ -140,22 +272,41 @@ def extract_tce_func(body: str) -> ExtractTceFunc:
     
     return ExtractTceFunc(name=varname, code=code)
 
-def extract_decipher_func(body: str, code: str) -> str:
+def extract_tce_vars(body: bytes, matches: Optional[BodyMatches] = None) -> bytes:
+    """Extract TCE global variables from JavaScript body"""
+    if matches is None:
+        matches = BodyMatches(body)
+    
+    tce_vars = b""
+    tce_vars_match = matches[_TCE_GLOBAL_VARS_RE]
+    
+    if tce_vars_match:
+        tce_vars = tce_vars_match.group(1)
+        if not tce_vars:
+            raise ValueError(f"No second capture group found using regex 'TCE_GLOBAL_VARS_REGEXP'")
+    
+    return tce_vars
+
+def extract_decipher_func(body: bytes, code: bytes, matches: Optional[BodyMatches] = None) -> bytes:
     """Extract decipher function from JavaScript body"""
-    sig_function_matcher = build_regex(TCE_SIGN_FUNCTION_REGEXP, re.DOTALL)
-    sig_function_match = sig_function_matcher.search(body)
+    if matches is None:
+        matches = BodyMatches(body)
     
-    sig_function_actions_matcher = build_regex(TCE_SIGN_FUNCTION_ACTION_REGEXP, re.DOTALL)
-    sig_function_actions_match = sig_function_actions_matcher.search(body)
+    sig_function_match = matches[_TCE_SIGN_FUNCTION_RE]
+    sig_function_actions_match = sig_function_match and matches[_TCE_SIGN_FUNCTION_ACTION_RE]
     
-    if sig_function_match and sig_function_actions_match:
-        return (
-            f"var {DECIPHER_FUNC_NAME}={sig_function_match.group(0)}"
-            f"{sig_function_actions_match.group(0)}{code};"
-        )
+    if sig_function_actions_match:
+        return b"".join((
+            b"var ", _DECIPHER_FUNC_NAME, b"=", sig_function_match.group(0),
+            sig_function_actions_match.group(0), code, b";"
+        ))
     
-    helper_matcher = build_regex(HELPER_REGEXP, re.DOTALL)
-    helper_match = helper_matcher.search(body)
+    # Both the plain and the TCE decipher function end with a join call, so
+    # without one the helper search below would be wasted
+    if b".join(" not in body:
+        raise ValueError(f"No captures found for input using regex 'FUNCTION_TCE_REGEXP'")
+    
+    helper_match = matches[_HELPER_RE]
     
     if not helper_match:
         raise ValueError(f"No captures found for input using regex 'HELPER_REGEXP'")
@@ -170,25 +321,16 @@ def extract_decipher_func(body: str, code: str) -> str:
     if not action_body:
         raise ValueError(f"No third capture group found using regex 'HELPER_REGEXP'")
     
-    pattern_regexes = [
-        build_regex(REVERSE_PATTERN),
-        build_regex(SLICE_PATTERN),
-        build_regex(SPLICE_PATTERN),
-        build_regex(SWAP_PATTERN)
-    ]
-    
-    if not any(pattern.search(action_body) for pattern in pattern_regexes):
+    if not _PATTERN_ANY_RE.search(action_body):
         raise ValueError(f"No captures found for input using regex 'PATTERN_REGEX_SET'")
     
-    func_matcher = build_regex(DECIPHER_REGEXP, re.DOTALL)
-    func_match = func_matcher.search(body)
+    func_match = matches[_DECIPHER_SCANNER]
     
     if func_match:
         decipher_func = func_match.group(0)
         is_tce = False
     else:
-        tce_func_matcher = build_regex(FUNCTION_TCE_REGEXP, re.DOTALL)
-        tce_func_match = tce_func_matcher.search(body)
+        tce_func_match = matches[_FUNCTION_TCE_RE]
         
         if not tce_func_match:
             raise ValueError(f"No captures found for input using regex 'FUNCTION_TCE_REGEXP'")
@@ -196,22 +338,22 @@ def extract_decipher_func(body: str, code: str) -> str:
         decipher_func = tce_func_match.group(0)
         is_tce = True
     
-    tce_vars = ""
-    if is_tce:
-        tce_vars_matcher = build_regex(TCE_GLOBAL_VARS_REGEXP, re.MULTILINE)
-        tce_vars_match = tce_vars_matcher.search(body)
-        
-        if tce_vars_match:
-            tce_vars = tce_vars_match.group(1)
-            if not tce_vars:
-                raise ValueError(f"No second capture group found using regex 'TCE_GLOBAL_VARS_REGEXP'")
+    tce_vars = extract_tce_vars(body, matches) if is_tce else b""
     
-    return f"{tce_vars};{helper_object}\nvar {DECIPHER_FUNC_NAME}={decipher_func};"
+    return b"".join((tce_vars, b";", helper_object, b"\nvar ", _DECIPHER_FUNC_NAME, b"=", decipher_func, b";"))
 
-def extract_n_transform_func(body: str, name: str, code: str) -> str:
+def extract_n_transform_func(
+    body: bytes, name: bytes, code: bytes, matches: Optional[BodyMatches] = None
+) -> bytes:
     """Extract n-transform function from JavaScript body"""
-    n_function_matcher = build_regex(TCE_N_FUNCTION_REGEXP, re.DOTALL)
-    n_function_match = n_function_matcher.search(body)
+    # Every n-transform variant wraps its body in a try/catch
+    if b"catch" not in body:
+        raise ValueError(f"No captures found for input using regex 'N_TRANSFORM_TCE_REGEXP'")
+    
+    if matches is None:
+        matches = BodyMatches(body)
+    
+    n_function_match = matches[_TCE_N_FUNCTION_RE]
     
     if n_function_match:
         n_function = n_function_match.group(0)
@@ -220,26 +362,18 @@ def extract_n_transform_func(body: str, name: str, code: str) -> str:
             raise ValueError(f"No first capture group found using regex 'TCE_N_FUNCTION_REGEXP'")
         
         # Handle short circuit pattern
-        tce_escape_name = re.escape(name)
-        short_circuit_pattern = build_regex(
-            rf";\s*if\s*\(\s*typeof\s+[a-zA-Z0-9_$]+\s*===?\s*(?:\"undefined\"|'undefined'|{tce_escape_name}\[\d+\])\s*\)\s*return\s+\w+;"
-        )
-        
-        short_circuit_match = short_circuit_pattern.search(n_function)
-        if short_circuit_match:
-            n_function = n_function.replace(short_circuit_match.group(0), ";")
+        short_circuit_match = _short_circuit_re(name).search(n_function)
+        parts = _splice_parts(n_function, short_circuit_match, b";")
         
-        return f"var {N_TRANSFORM_FUNC_NAME}={n_function}{code};"
+        return b"".join((b"var ", _N_TRANSFORM_FUNC_NAME, b"=", *parts, code, b";"))
     
-    n_matcher = build_regex(N_TRANSFORM_REGEXP, re.DOTALL)
-    n_match = n_matcher.search(body)
+    n_match = matches[_N_TRANSFORM_RE]
     
     if n_match:
         n_function = n_match.group(0)
         is_tce = False
     else:
-        n_tce_matcher = build_regex(N_TRANSFORM_TCE_REGEXP, re.DOTALL)
-        n_tce_match = n_tce_matcher.search(body)
+        n_tce_match = matches[_N_TRANSFORM_TCE_RE]
         
         if not n_tce_match:
             raise ValueError(f"No captures found for input using regex 'N_TRANSFORM_TCE_REGEXP'")
@@ -250,8 +384,7 @@ def extract_n_transform_func(body: str, name: str, code: str) -> str:
         
         is_tce = True
     
-    param_matcher = build_regex(FOR_PARAM_MATCHING)
-    param_match = param_matcher.search(n_function)
+    param_match = _FOR_PARAM_RE.search(n_function)
     
     if not param_match:
         raise ValueError(f"No captures found for input using regex 'FOR_PARAM_MATCHING'")
@@ -260,20 +393,9 @@ def extract_n_transform_func(body: str, name: str, code: str) -> str:
     if not param_name:
         raise ValueError(f"No second capture group found using regex 'FOR_PARAM_MATCHING'")
     
-    # Clean function
-    cleaned_function_pattern = build_regex(
-        rf"if\s*\(typeof\s*[^\s()]+\s*===?.*?\)return {re.escape(param_name)}\s*;?"
-    )
-    cleaned_function = cleaned_function_pattern.sub("", n_function)
+    # Clean function: remove every typeof guard on the parameter
+    cleaned_function = _cleaned_function_re(param_name).sub(b"", n_function)
     
-    tce_vars = ""
-    if is_tce:
-        tce_vars_matcher = build_regex(TCE_GLOBAL_VARS_REGEXP, re.MULTILINE)
-        tce_vars_match = tce_vars_matcher.search(body)
-        
-        if tce_vars_match:
-            tce_vars = tce_vars_match.group(1)
-            if not tce_vars:
-                raise ValueError(f"No second capture group found using regex 'TCE_GLOBAL_VARS_REGEXP'")
+    tce_vars = extract_tce_vars(body, matches) if is_tce else b""
     
-    return f"{tce_vars};var {N_TRANSFORM_FUNC_NAME}={cleaned_function};"
\ No newline at end of file
+    return b"".join((tce_vars, b";var ", _N_TRANSFORM_FUNC_NAME, b"=", cleaned_function, b";"))
\ No newline at end of file
@@ -1,23 +1,386 @@
+import functools
 import subprocess
 import tempfile
 import os
+import hashlib
 import json
 import logging
+import queue
 import requests
 import re
+import threading
+import time
 import urllib.parse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from typing import Dict, List, Optional, Tuple
+import lib
+import sig
 from lib import extract_decode_script_simple
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_PAGE_CHUNK_SIZE = 64 * 1024
+
+_PLAYER_URL_PREFIX = b'"jsUrl":"'
+_PLAYER_URL_RE = re.compile(rb'"jsUrl":"([^"]+)"')
+_YTIPR_PREFIX = b'var ytInitialPlayerResponse = '
+_SCRIPT_END = b'</script>'
+
+_N_RE = re.compile(r'([?&])n=([^&]*)')
+# A JSON string literal or a lone brace; skipping whole strings keeps braces
+# inside them from being counted
+_JSON_TOKEN_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]', re.DOTALL)
+
+def _json_loads(data):
+    """Parse JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps_pretty(obj) -> str:
+    """Serialize to two-space indented JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+def _scan_json_end(buf, start: int, end: int) -> int:
+    """Byte-at-a-time _find_json_end, written so Numba can compile it"""
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, end):
+        char = buf[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == 0x5C:  # backslash
+                escaped = True
+            elif char == 0x22:  # "
+                in_string = False
+        elif char == 0x22:
+            in_string = True
+        elif char == 0x7B:  # {
+            depth += 1
+        elif char == 0x7D:  # }
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return -1
+
+@functools.lru_cache(maxsize=None)
+def _compiled_json_end_scanner():
+    """Return _scan_json_end compiled by Numba, or None if Numba is not installed
+    
+    Importing Numba costs far more than it saves on a single page, so this is
+    only done for callers that opt in.
+    """
+    try:
+        import numba
+        import numpy as np
+    except ImportError:
+        return None
+    
+    scan = numba.njit(cache=True)(_scan_json_end)
+    return lambda data, start, end: int(scan(np.frombuffer(data, dtype=np.uint8), start, end))
+
+def _find_json_end(data: bytes, start: int, end: int, use_numba: bool = False) -> int:
+    """Return the index just past the JSON object opening at data[start], or -1 if it does not close before end"""
+    if use_numba:
+        scan = _compiled_json_end_scanner()
+        if scan is not None:
+            return scan(data, start, end)
+    
+    depth = 0
+    for match in _JSON_TOKEN_RE.finditer(data, start, end):
+        char = data[match.start()]
+        if char == 0x7B:  # {
+            depth += 1
+        elif char == 0x7D:  # }
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return -1
+
+class _WatchPageScanner:
+    """Finds the player URL and player response in a watch page as it streams in"""
+    
+    def __init__(self, use_numba: bool = False):
+        self.page = bytearray()
+        self.player_url: Optional[bytes] = None
+        self.player_response: Optional[Tuple[int, int]] = None
+        self._url_pos = 0
+        self._response_pos = 0
+        self._use_numba = use_numba
+    
+    def feed(self, chunk: bytes) -> bool:
+        """Append a chunk of the page, returning True once both parts are found"""
+        self.page += chunk
+        if self.player_url is None:
+            self._scan_player_url()
+        if self.player_response is None:
+            self._scan_player_response()
+        return self.player_url is not None and self.player_response is not None
+    
+    def _scan_player_url(self):
+        page = self.page
+        while True:
+            start = page.find(_PLAYER_URL_PREFIX, self._url_pos)
+            if start < 0:
+                self._url_pos = max(self._url_pos, len(page) - len(_PLAYER_URL_PREFIX) + 1)
+                return
+            
+            self._url_pos = start
+            match = _PLAYER_URL_RE.match(page, start)
+            if match:
+                self.player_url = match.group(1)
+                return
+            if page.find(b'"', start + len(_PLAYER_URL_PREFIX)) < 0:
+                return  # the rest of the URL has not arrived yet
+            self._url_pos = start + 1
+    
+    def _scan_player_response(self):
+        page = self.page
+        while True:
+            prefix = page.find(_YTIPR_PREFIX, self._response_pos)
+            if prefix < 0:
+                self._response_pos = max(self._response_pos, len(page) - len(_YTIPR_PREFIX) + 1)
+                return
+            
+            self._response_pos = prefix
+            start = prefix + len(_YTIPR_PREFIX)
+            # The JSON cannot contain a literal </script>, so wait for the end of
+            # the script element and scan for the closing brace only once
+            script_end = page.find(_SCRIPT_END, start)
+            if script_end < 0:
+                return
+            if page.startswith(b'{', start):
+                end = _find_json_end(page, start, script_end, self._use_numba)
+                if end >= 0:
+                    self.player_response = (start, end)
+                    return
+            self._response_pos = prefix + 1
+
+def _replace_n(url: str, decrypted_n: str) -> str:
+    """Replace the value of the n query parameter in url"""
+    return _N_RE.sub(lambda match: f"{match.group(1)}n={decrypted_n}", url, count=1)
+
+def _default_cache_dir() -> str:
+    """Return the directory used to cache player code between runs"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'yt-decrypt')
+
+# Cache files left unmodified this long are removed when a new player is downloaded
+_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+@functools.lru_cache(maxsize=None)
+def _extractor_version() -> Optional[str]:
+    """Return a hash of the extractor sources, or None if they cannot be read
+    
+    Cached scripts are keyed by it, so a changed extractor never serves a
+    script made by the old one.
+    """
+    digest = hashlib.sha1()
+    try:
+        for module in (sig, lib):
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+    except (OSError, TypeError):
+        return None
+    return digest.hexdigest()[:12]
+
+def _read_cache(path: str) -> Optional[bytes]:
+    """Return the contents of a cache file, or None if it cannot be read"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_cache(path: str, data: bytes):
+    """Atomically replace a cache file, logging instead of raising on failure"""
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, path)
+        except BaseException:
+            os.unlink(temp_file)
+            raise
+    except OSError as e:
+        logger.warning("Could not write cache file %s: %s", path, e)
+
+def _prune_cache(directory: str):
+    """Remove cache files that have not been modified for _CACHE_MAX_AGE seconds"""
+    cutoff = time.time() - _CACHE_MAX_AGE
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+    except OSError as e:
+        logger.warning("Could not prune cache directory %s: %s", directory, e)
+
+# Worker harness run with `node -e`. Each stdin line is a JSON request; the
+# "load" op evaluates the decrypt script once, later ops call into it. One
+# JSON response line is written to stdout per request. In a "batch" request a
+# value that throws comes back as null instead of failing the whole batch.
+# When "load" is given a cachePath, V8's compiled code for the script is kept
+# there so later workers can skip parsing and compiling it again.
+_WORKER_HARNESS = r"""
+const fs = require('fs');
+const readline = require('readline');
+const vm = require('vm');
+const FUNCS = { sig: 'DisTubeDecipherFunc', n: 'DisTubeNTransformFunc' };
+const send = (msg) => process.stdout.write(JSON.stringify(msg) + '\n');
+const tryCall = (name, value) => {
+    try {
+        return globalThis[name](value);
+    } catch (error) {
+        return null;
+    }
+};
+const load = (code, cachePath) => {
+    let cachedData;
+    if (cachePath) {
+        try {
+            cachedData = fs.readFileSync(cachePath);
+        } catch (error) {}
+    }
+    const script = new vm.Script(code, { cachedData });
+    script.runInThisContext();
+    if (cachePath && (!cachedData || script.cachedDataRejected)) {
+        const tempPath = `${cachePath}.${process.pid}.tmp`;
+        try {
+            fs.writeFileSync(tempPath, script.createCachedData());
+            fs.renameSync(tempPath, cachePath);
+        } catch (error) {
+            try {
+                fs.unlinkSync(tempPath);
+            } catch (ignored) {}
+        }
+    }
+};
+console.log = console.error;
+readline.createInterface({ input: process.stdin })
+    .on('line', (line) => {
+        const { id, op, arg } = JSON.parse(line);
+        try {
+            if (op === 'load') {
+                load(arg.code, arg.cachePath);
+                send({ id, r: null });
+            } else if (op === 'batch') {
+                send({ id, r: {
+                    sigs: arg.sigs.map((value) => tryCall(FUNCS.sig, value)),
+                    ns: arg.ns.map((value) => tryCall(FUNCS.n, value)),
+                } });
+            } else {
+                send({ id, r: globalThis[FUNCS[op]](arg) });
+            }
+        } catch (error) {
+            send({ id, e: String(error && error.message || error) });
+        }
+    })
+    .on('close', () => process.exit(0));
+"""
+
+class NodeWorker:
+    """Long-lived Node.js process with a decrypt script loaded into it"""
+    
+    def __init__(self, decrypt_script: str, code_cache_path: Optional[str] = None, timeout: int = 30):
+        self.decrypt_script = decrypt_script
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.process = subprocess.Popen(
+            ['node', '-e', _WORKER_HARNESS],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding='utf-8'
+        )
+        # Responses are read on a separate thread so that call() can give up on
+        # a function that never returns
+        self._responses: queue.Queue = queue.Queue()
+        threading.Thread(target=self._read_responses, daemon=True).start()
+        try:
+            self.call('load', {'code': decrypt_script, 'cachePath': code_cache_path})
+        except Exception:
+            self.close()
+            raise
+    
+    def call(self, op: str, arg):
+        """Send one request to the worker and return its result"""
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            try:
+                self.process.stdin.write(json.dumps({'id': request_id, 'op': op, 'arg': arg}) + '\n')
+                self.process.stdin.flush()
+                line = self._responses.get(timeout=self.timeout)
+            except queue.Empty:
+                # A stuck worker cannot be reused; killing it makes the executor start a new one
+                self.process.kill()
+                self.process.wait()
+                raise RuntimeError(f"JavaScript execution timed out after {self.timeout} seconds")
+            except (BrokenPipeError, OSError, ValueError):
+                line = ''
+            
+            if not line:
+                raise RuntimeError(f"Node.js worker exited unexpectedly (code {self.process.poll()})")
+        
+        response = json.loads(line)
+        if response.get('id') != request_id:
+            raise RuntimeError(f"Node.js worker answered request {response.get('id')}, expected {request_id}")
+        if 'e' in response:
+            raise RuntimeError(f"JavaScript execution failed: {response['e']}")
+        if 'r' not in response:
+            # JSON.stringify drops a result of undefined
+            raise RuntimeError("JavaScript function returned no value")
+        return response['r']
+    
+    def _read_responses(self):
+        """Queue each line the worker writes, then '' once its output closes"""
+        try:
+            for line in self.process.stdout:
+                self._responses.put(line)
+        except (OSError, ValueError):
+            pass
+        self._responses.put('')
+    
+    def close(self):
+        """Stop the worker process"""
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
 class JavaScriptExecutor:
     """Helper class to execute JavaScript code using Node.js"""
     
-    def __init__(self):
+    def __init__(self, code_cache_dir: Optional[str] = None):
         self.node_available = self._check_node_available()
+        self.code_cache_dir = code_cache_dir
+        self._worker: Optional[NodeWorker] = None
+        self._worker_lock = threading.Lock()
     
     def _check_node_available(self) -> bool:
         """Check if Node.js is available"""
@@ -39,6 +402,7 @@ class JavaScriptExecutor:
             
             result = subprocess.run(
                 ['node', temp_file],
+                stdin=subprocess.DEVNULL,
                 capture_output=True,
                 text=True,
                 timeout=timeout
@@ -61,110 +425,212 @@ class JavaScriptExecutor:
                     pass
             raise
     
+    def _ensure_worker(self, decrypt_script: str) -> NodeWorker:
+        """Return a worker with decrypt_script loaded, starting one if needed"""
+        if not self.node_available:
+            raise RuntimeError("Node.js is not available. Please install Node.js to execute JavaScript.")
+        
+        with self._worker_lock:
+            worker = self._worker
+            if worker is None or worker.process.poll() is not None or worker.decrypt_script != decrypt_script:
+                if worker is not None:
+                    worker.close()
+                self._worker = None
+                code_cache_path = None
+                if self.code_cache_dir:
+                    key = hashlib.sha1(decrypt_script.encode('utf-8')).hexdigest()
+                    code_cache_path = os.path.join(self.code_cache_dir, key + '.v8cache')
+                    try:
+                        os.makedirs(self.code_cache_dir, exist_ok=True)
+                    except OSError as e:
+                        logger.warning("Could not create cache directory %s: %s", self.code_cache_dir, e)
+                worker = self._worker = NodeWorker(decrypt_script, code_cache_path)
+            return worker
+    
     def decrypt_signature(self, decrypt_script: str, signature: str) -> str:
         """Decrypt a signature using the provided script"""
-        js_code = f"""
-        {decrypt_script}
-        
-        try {{
-            const result = DisTubeDecipherFunc('{signature}');
-            console.log(result);
-        }} catch (error) {{
-            console.error('Error:', error.message);
-            process.exit(1);
-        }}
-        """
-        
-        return self.execute_js(js_code)
+        return self._ensure_worker(decrypt_script).call('sig', signature)
     
     def decrypt_n_parameter(self, decrypt_script: str, n_param: str) -> str:
         """Decrypt n parameter using the provided script"""
-        js_code = f"""
-        {decrypt_script}
-        
-        try {{
-            const result = DisTubeNTransformFunc('{n_param}');
-            console.log(result);
-        }} catch (error) {{
-            console.error('Error:', error.message);
-            process.exit(1);
-        }}
-        """
+        return self._ensure_worker(decrypt_script).call('n', n_param)
+    
+    def batch_decrypt(self, decrypt_script: str, sigs: List[str], ns: List[str]) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+        """Decrypt many signatures and n parameters in one round-trip, None marks a failed value"""
+        if not sigs and not ns:
+            return [], []
         
-        return self.execute_js(js_code)
+        result = self._ensure_worker(decrypt_script).call('batch', {'sigs': sigs, 'ns': ns})
+        return result['sigs'], result['ns']
+    
+    def close(self):
+        """Stop the Node.js worker, if one is running"""
+        with self._worker_lock:
+            if self._worker is not None:
+                self._worker.close()
+                self._worker = None
 
 class YouTubeDecryptor:
     """Complete YouTube decryptor with JavaScript execution"""
     
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None, use_numba: bool = False):
         self.player_url = None
         self.player_code = None
+        self._player_code_url = None
         self.decrypt_script = None
-        self.js_executor = JavaScriptExecutor()
+        self.use_numba = use_numba
+        self.cache_dir = cache_dir or _default_cache_dir()
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._player_future = None
+        self.js_executor = JavaScriptExecutor(code_cache_dir=self.cache_dir)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # Keep connections to the YouTube hosts alive between requests and retry
+        # transient failures instead of failing the whole run
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        ))
     
     def get_video_info(self, video_id: str) -> Dict:
         """Get video information from YouTube"""
         try:
             video_url = f"https://www.youtube.com/watch?v={video_id}"
-            response = self.session.get(video_url)
-            response.raise_for_status()
+            scanner = _WatchPageScanner(self.use_numba)
+            found_player_url = False
             
-            # Extract player URL
-            player_url_match = re.search(r'"jsUrl":"([^"]+)"', response.text)
-            if not player_url_match:
-                raise ValueError("Could not find player URL")
+            # Stop reading the page as soon as everything needed has been seen
+            with self.session.get(video_url, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(_PAGE_CHUNK_SIZE):
+                    done = scanner.feed(chunk)
+                    if not found_player_url and scanner.player_url is not None:
+                        found_player_url = True
+                        self._set_player_url(scanner.player_url)
+                    if done:
+                        break
             
-            player_url = player_url_match.group(1).replace('\\/', '/')
-            if player_url.startswith('//'):
-                player_url = 'https:' + player_url
-            elif player_url.startswith('/'):
-                player_url = 'https://www.youtube.com' + player_url
-            
-            self.player_url = player_url
-            logger.info(f"Found player URL: {player_url}")
-            
-            # Extract video data
-            ytInitialPlayerResponse_match = re.search(
-                r'var ytInitialPlayerResponse = ({.+?});', response.text
-            )
-            if not ytInitialPlayerResponse_match:
+            if not found_player_url:
+                raise ValueError("Could not find player URL")
+            if scanner.player_response is None:
                 raise ValueError("Could not find ytInitialPlayerResponse")
             
-            video_data = json.loads(ytInitialPlayerResponse_match.group(1))
+            # Extract video data
+            start, end = scanner.player_response
+            video_data = _json_loads(scanner.page[start:end])
             return video_data
             
         except Exception as e:
-            logger.error(f"Error getting video info: {e}")
+            logger.error("Error getting video info: %s", e)
             raise
     
-    def get_player_code(self) -> str:
+    def _set_player_url(self, raw_url: bytes):
+        """Store the absolute player URL and start fetching the player code"""
+        player_url = raw_url.decode('utf-8').replace('\\/', '/')
+        if player_url.startswith('//'):
+            player_url = 'https:' + player_url
+        elif player_url.startswith('/'):
+            player_url = 'https://www.youtube.com' + player_url
+        
+        if player_url != self.player_url:
+            # Code and script from the previous player must not be reused
+            self.player_code = None
+            self._player_code_url = None
+            self.decrypt_script = None
+            self._player_future = None
+        
+        self.player_url = player_url
+        logger.info("Found player URL: %s", player_url)
+        self._prefetch_player_code()
+    
+    def _cache_path(self, suffix: str) -> str:
+        """Return the cache file for the current player URL"""
+        key = hashlib.sha1(self.player_url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + suffix)
+    
+    def _script_cache_path(self) -> Optional[str]:
+        """Return the cache path of the decrypt script, or None if it cannot be cached"""
+        version = _extractor_version()
+        if version is None:
+            return None
+        return self._cache_path(f'.{version}.script.js')
+    
+    def get_player_code(self) -> bytes:
         """Download and cache the player code"""
-        if self.player_code and self.player_url:
+        if self.player_code and self.player_url and self._player_code_url == self.player_url:
             return self.player_code
         
         if not self.player_url:
             raise ValueError("Player URL not found. Call get_video_info first.")
         
+        player_url = self.player_url
+        cache_path = self._cache_path('.js')
+        prefetch, self._player_future = self._player_future, None
+        
         try:
-            logger.info(f"Downloading player code from: {self.player_url}")
-            response = self.session.get(self.player_url)
-            response.raise_for_status()
-            
-            self.player_code = response.text
-            logger.info(f"Downloaded player code ({len(self.player_code)} characters)")
-            return self.player_code
+            if prefetch is not None and prefetch[0] == player_url:
+                player_code = prefetch[1].result()
+            else:
+                player_code = _read_cache(cache_path)
+                if player_code:
+                    logger.info("Loaded player code from cache: %s", cache_path)
+                else:
+                    player_code = self._download_player_code(player_url, cache_path)
             
         except Exception as e:
-            logger.error(f"Error downloading player code: {e}")
+            logger.error("Error downloading player code: %s", e)
             raise
+        
+        self.player_code = player_code
+        self._player_code_url = player_url
+        return player_code
+    
+    def _download_player_code(self, player_url: str, cache_path: str) -> bytes:
+        """Download the player code and store it in the cache"""
+        logger.info("Downloading player code from: %s", player_url)
+        response = self.session.get(player_url)
+        response.raise_for_status()
+        
+        # Kept as bytes: the extractor matches raw bytes and decodes only the
+        # functions it cuts out
+        player_code = response.content
+        logger.info("Downloaded player code (%d bytes)", len(player_code))
+        _write_cache(cache_path, player_code)
+        # A new player replaces the old ones, so drop entries nothing has used
+        _prune_cache(self.cache_dir)
+        return player_code
+    
+    def _prefetch_player_code(self):
+        """Start downloading the player code in the background unless it is cached"""
+        if (self.player_code and self._player_code_url == self.player_url) or self._player_future is not None:
+            return
+        
+        cache_path = self._cache_path('.js')
+        script_cache_path = self._script_cache_path()
+        if (script_cache_path and os.path.exists(script_cache_path)) or os.path.exists(cache_path):
+            return
+        
+        future = self._executor.submit(self._download_player_code, self.player_url, cache_path)
+        self._player_future = (self.player_url, future)
     
     def extract_decrypt_functions(self) -> str:
         """Extract decipher and n-transform functions from player code"""
-        if not self.player_code:
+        script_cache_path = self._script_cache_path() if self.player_url else None
+        if script_cache_path:
+            cached = _read_cache(script_cache_path)
+            try:
+                decrypt_script = cached.decode('utf-8') if cached else None
+            except UnicodeDecodeError:
+                decrypt_script = None
+            if decrypt_script:
+                self.decrypt_script = decrypt_script
+                logger.info("Loaded decrypt functions from cache: %s", script_cache_path)
+                return self.decrypt_script
+        
+        if not self.player_code or self._player_code_url != self.player_url:
             self.get_player_code()
         
         try:
@@ -172,10 +638,12 @@ class YouTubeDecryptor:
             decrypt_script = extract_decode_script_simple(self.player_code)
             self.decrypt_script = decrypt_script
             logger.info("Successfully extracted decrypt functions")
+            if script_cache_path:
+                _write_cache(script_cache_path, decrypt_script.encode('utf-8'))
             return decrypt_script
             
         except Exception as e:
-            logger.error(f"Error extracting decrypt functions: {e}")
+            logger.error("Error extracting decrypt functions: %s", e)
             raise
     
     def decrypt_signature(self, signature: str) -> str:
@@ -185,11 +653,12 @@ class YouTubeDecryptor:
         
         try:
             decrypted = self.js_executor.decrypt_signature(self.decrypt_script, signature)
-            logger.info(f"Successfully decrypted signature: {signature[:10]}... -> {decrypted[:10]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Successfully decrypted signature: %s... -> %s...", signature[:10], decrypted[:10])
             return decrypted
             
         except Exception as e:
-            logger.error(f"Error decrypting signature: {e}")
+            logger.error("Error decrypting signature: %s", e)
             raise
     
     def decrypt_n_parameter(self, n_param: str) -> str:
@@ -199,107 +668,166 @@ class YouTubeDecryptor:
         
         try:
             decrypted = self.js_executor.decrypt_n_parameter(self.decrypt_script, n_param)
-            logger.info(f"Successfully decrypted n parameter: {n_param[:10]}... -> {decrypted[:10]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Successfully decrypted n parameter: %s... -> %s...", n_param[:10], decrypted[:10])
             return decrypted
             
         except Exception as e:
-            logger.error(f"Error decrypting n parameter: {e}")
+            logger.error("Error decrypting n parameter: %s", e)
             raise
     
     def get_video_formats(self, video_id: str) -> List[Dict]:
         """Get and decrypt video formats"""
         try:
-            # Get video info and setup decryption
             video_data = self.get_video_info(video_id)
-            self.get_player_code()
-            self.extract_decrypt_functions()
             
             # Extract streaming data
             streaming_data = video_data.get('streamingData', {})
             formats = streaming_data.get('formats', []) + streaming_data.get('adaptiveFormats', [])
             
-            decrypted_formats = []
+            # Pass 1: emit formats that need no decryption right away and collect
+            # the signatures and n parameters of the rest, tagged by position.
+            # Formats often share values, so each distinct one is sent only once
+            decrypted_formats: List[Optional[Dict]] = [None] * len(formats)
+            jobs = []
+            sig_indexes: Dict[str, int] = {}
+            n_indexes: Dict[str, int] = {}
             
-            for fmt in formats:
+            for index, fmt in enumerate(formats):
                 try:
                     # Check if URL needs decryption
                     if 'url' in fmt:
-                        decrypted_url = fmt['url']
+                        url, signature, sp = fmt['url'], '', None
                     elif 'signatureCipher' in fmt:
                         # Parse signature cipher
-                        cipher_data = urllib.parse.parse_qs(fmt['signatureCipher'])
-                        
-                        url = cipher_data.get('url', [''])[0]
-                        signature = cipher_data.get('s', [''])[0]
-                        sp = cipher_data.get('sp', ['sig'])[0]
+                        cipher_data = dict(urllib.parse.parse_qsl(fmt['signatureCipher']))
                         
-                        if signature:
-                            # Decrypt signature
-                            decrypted_sig = self.decrypt_signature(signature)
-                            decrypted_url = f"{url}&{sp}={decrypted_sig}"
-                        else:
-                            decrypted_url = url
+                        url = cipher_data.get('url', '')
+                        signature = cipher_data.get('s', '')
+                        sp = cipher_data.get('sp', 'sig')
                     else:
-                        logger.warning(f"Unknown format structure: {fmt}")
+                        logger.warning("Unknown format structure: %s", fmt)
                         continue
                     
+                    sig_index = None
+                    if signature:
+                        sig_index = sig_indexes.setdefault(signature, len(sig_indexes))
+                    
                     # Handle n parameter if present
-                    if 'n=' in decrypted_url:
-                        n_match = re.search(r'[?&]n=([^&]*)', decrypted_url)
+                    n_index = None
+                    if 'n=' in url:
+                        n_match = _N_RE.search(url)
                         if n_match:
-                            n_param = n_match.group(1)
-                            decrypted_n = self.decrypt_n_parameter(n_param)
-                            decrypted_url = decrypted_url.replace(f'n={n_param}', f'n={decrypted_n}')
-                    
-                    # Add format info
-                    format_info = {
-                        'itag': fmt.get('itag'),
-                        'url': decrypted_url,
-                        'quality': fmt.get('quality'),
-                        'qualityLabel': fmt.get('qualityLabel'),
-                        'mimeType': fmt.get('mimeType'),
-                        'filesize': fmt.get('contentLength'),
-                        'fps': fmt.get('fps'),
-                        'bitrate': fmt.get('bitrate'),
-                        'width': fmt.get('width'),
-                        'height': fmt.get('height'),
-                        'audioQuality': fmt.get('audioQuality'),
-                        'audioSampleRate': fmt.get('audioSampleRate'),
-                    }
+                            n_index = n_indexes.setdefault(n_match.group(2), len(n_indexes))
                     
-                    decrypted_formats.append(format_info)
+                    if sig_index is None and n_index is None:
+                        decrypted_formats[index] = self._format_info(fmt, url)
+                    else:
+                        jobs.append((index, fmt, url, sp, sig_index, n_index))
                     
                 except Exception as e:
-                    logger.error(f"Error processing format {fmt.get('itag')}: {e}")
+                    logger.error("Error processing format %s: %s", fmt.get('itag'), e)
                     continue
             
-            return decrypted_formats
+            if jobs:
+                sigs, ns = list(sig_indexes), list(n_indexes)
+                # A player without decrypt functions fails the call, while a
+                # worker failure only drops the formats that needed decrypting
+                self.extract_decrypt_functions()
+                try:
+                    decrypted_sigs, decrypted_ns = self.js_executor.batch_decrypt(self.decrypt_script, sigs, ns)
+                    logger.info("Decrypted %d signatures and %d n parameters", len(sigs), len(ns))
+                except Exception as e:
+                    logger.error("Error decrypting %d formats: %s", len(jobs), e)
+                    jobs = []
+            
+            # Pass 2: rebuild the URLs from the decrypted values
+            for index, fmt, url, sp, sig_index, n_index in jobs:
+                decrypted_url = url
+                
+                if n_index is not None:
+                    decrypted_n = decrypted_ns[n_index]
+                    if decrypted_n is None:
+                        logger.error("Error processing format %s: n parameter decryption failed", fmt.get('itag'))
+                        continue
+                    decrypted_url = _replace_n(decrypted_url, decrypted_n)
+                
+                if sig_index is not None:
+                    decrypted_sig = decrypted_sigs[sig_index]
+                    if decrypted_sig is None:
+                        logger.error("Error processing format %s: signature decryption failed", fmt.get('itag'))
+                        continue
+                    decrypted_url = f"{decrypted_url}&{sp}={decrypted_sig}"
+                
+                decrypted_formats[index] = self._format_info(fmt, decrypted_url)
+            
+            return [format_info for format_info in decrypted_formats if format_info is not None]
             
         except Exception as e:
-            logger.error(f"Error getting video formats: {e}")
+            logger.error("Error getting video formats: %s", e)
             raise
     
+    @staticmethod
+    def _format_info(fmt: Dict, url: str) -> Dict:
+        """Build the format entry returned by get_video_formats"""
+        return {
+            'itag': fmt.get('itag'),
+            'url': url,
+            'quality': fmt.get('quality'),
+            'qualityLabel': fmt.get('qualityLabel'),
+            'mimeType': fmt.get('mimeType'),
+            'filesize': fmt.get('contentLength'),
+            'fps': fmt.get('fps'),
+            'bitrate': fmt.get('bitrate'),
+            'width': fmt.get('width'),
+            'height': fmt.get('height'),
+            'audioQuality': fmt.get('audioQuality'),
+            'audioSampleRate': fmt.get('audioSampleRate'),
+        }
+    
     def save_urls_to_file(self, formats: List[Dict], filename: str = "video_urls.txt"):
         """Save all video URLs to a file"""
         try:
+            parts = [
+                f"YouTube Video URLs - Generated on {datetime.now().isoformat(timespec='seconds')}\n",
+                "=" * 80 + "\n\n",
+            ]
+            separator = "\n" + "-" * 80 + "\n\n"
+            
+            for i, fmt in enumerate(formats):
+                parts.append(
+                    f"Format {i+1}:\n"
+                    f"  Quality: {fmt.get('qualityLabel') or fmt.get('quality', 'Unknown')}\n"
+                    f"  Type: {fmt.get('mimeType', 'Unknown')}\n"
+                    f"  Bitrate: {fmt.get('bitrate', 'Unknown')}\n"
+                    f"  Filesize: {fmt.get('filesize', 'Unknown')}\n"
+                    f"  URL: {fmt['url']}\n"
+                    f"{separator}"
+                )
+            
             with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"YouTube Video URLs - Generated on {json.dumps({}.__class__.__name__)}\n")
-                f.write("=" * 80 + "\n\n")
-                
-                for i, fmt in enumerate(formats):
-                    f.write(f"Format {i+1}:\n")
-                    f.write(f"  Quality: {fmt.get('qualityLabel') or fmt.get('quality', 'Unknown')}\n")
-                    f.write(f"  Type: {fmt.get('mimeType', 'Unknown')}\n")
-                    f.write(f"  Bitrate: {fmt.get('bitrate', 'Unknown')}\n")
-                    f.write(f"  Filesize: {fmt.get('filesize', 'Unknown')}\n")
-                    f.write(f"  URL: {fmt['url']}\n")
-                    f.write("\n" + "-" * 80 + "\n\n")
+                f.write(''.join(parts))
             
-            logger.info(f"URLs saved to {filename}")
+            logger.info("URLs saved to %s", filename)
             
         except Exception as e:
-            logger.error(f"Error saving URLs: {e}")
+            logger.error("Error saving URLs: %s", e)
             raise
+    
+    def close(self):
+        """Release the Node.js worker, background threads and HTTP connections"""
+        self._executor.shutdown(wait=True)
+        self.js_executor.close()
+        self.session.close()
+
+_PROBE_TIMEOUT = 10
+
+def _probe_url(session: requests.Session, url: str, result: Dict):
+    """Send a HEAD request to url, storing the response or the error in result"""
+    try:
+        result['response'] = session.head(url, timeout=_PROBE_TIMEOUT)
+    except Exception as e:
+        result['error'] = e
 
 def main():
     """Main function"""
@@ -323,6 +851,17 @@ def main():
                   f"Type: {fmt.get('mimeType', 'Unknown')[:30]:30} | "
                   f"Bitrate: {fmt.get('bitrate', 'Unknown')}")
         
+        # Test URL accessibility in the background while the files are written
+        probe = None
+        probe_result = {}
+        if formats:
+            probe = threading.Thread(
+                target=_probe_url,
+                args=(decryptor.session, formats[0]['url'], probe_result),
+                daemon=True
+            )
+            probe.start()
+        
         # Save all URLs to file
         decryptor.save_urls_to_file(formats, "video_urls.txt")
         print(f"\n✓ All URLs saved to video_urls.txt")
@@ -334,11 +873,18 @@ def main():
             print("=" * 80)
             print(formats[0]['url'])
             print("=" * 80)
-            
-            # Test URL accessibility
+        
+        # Save decrypt script
+        if decryptor.decrypt_script:
+            with open("decrypt_script.js", 'w', encoding='utf-8') as f:
+                f.write(decryptor.decrypt_script)
+            print("\n✓ Decrypt script saved to decrypt_script.js")
+        
+        if probe is not None:
             print("\nTesting URL accessibility...")
-            try:
-                response = decryptor.session.head(formats[0]['url'], timeout=10)
+            probe.join(timeout=_PROBE_TIMEOUT)
+            response = probe_result.get('response')
+            if response is not None:
                 print(f"✓ URL Status: {response.status_code}")
                 if response.status_code == 200:
                     print("✓ URL is valid and accessible")
@@ -348,14 +894,8 @@ def main():
                         print(f"✓ Content length: {int(content_length):,} bytes")
                 else:
                     print(f"✗ URL returned status {response.status_code}")
-            except Exception as e:
-                print(f"✗ URL test failed: {e}")
-        
-        # Save decrypt script
-        if decryptor.decrypt_script:
-            with open("decrypt_script.js", 'w', encoding='utf-8') as f:
-                f.write(decryptor.decrypt_script)
-            print("\n✓ Decrypt script saved to decrypt_script.js")
+            else:
+                print(f"✗ URL test failed: {probe_result.get('error', 'timed out')}")
         
         print("\n" + "=" * 80)
         print("SUMMARY:")
@@ -367,6 +907,8 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
         logger.exception("Full error details:")
+    finally:
+        decryptor.close()
 
 def detailed_format_info(video_id: str):
     """Show detailed format information"""
@@ -395,13 +937,15 @@ def detailed_format_info(video_id: str):
         
         # Save detailed info to JSON
         with open(f"detailed_formats_{video_id}.json", 'w', encoding='utf-8') as f:
-            json.dump(formats, f, indent=2, ensure_ascii=False)
+            f.write(_json_dumps_pretty(formats))
         
         print(f"\n✓ Detailed format info saved to detailed_formats_{video_id}.json")
         
     except Exception as e:
         print(f"Error: {e}")
         logger.exception("Full error details:")
+    finally:
+        decryptor.close()
 
 if __name__ == "__main__":
     import sys
@@ -427,5 +971,7 @@ if __name__ == "__main__":
                 
             except Exception as e:
                 print(f"Error: {e}")
+            finally:
+                decryptor.close()
     else:
         main()
\ No newline at end of file